@@ -0,0 +1,68 @@
+import logging
+import functools
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+
+from secrets_cache import get_cached_secret
+
+# ---------------------------
+# Key Vault Setup
+# ---------------------------
+storage_connection_string_secret_name = "AzureStorageConnectionString"
+
+def get_storage_connection_string(key_vault_name):
+    """Retrieve the Azure Storage connection string from Key Vault (memoized by get_cached_secret)."""
+    logging.info("Attempting to retrieve Azure Storage connection string from Key Vault.")
+    connection_string = get_cached_secret(key_vault_name, storage_connection_string_secret_name)
+
+    if not connection_string:
+        logging.error("Azure Storage connection string not found or empty.")
+        raise ValueError("Azure Storage connection string not found or empty.")
+    logging.info("Successfully retrieved Azure Storage connection string.")
+    return connection_string
+
+# ---------------------------
+# Blob Storage Client
+# ---------------------------
+# Sized above the largest max_concurrency used by the scripts to avoid "Connection pool is full" warnings
+connection_pool_maxsize = 32
+
+# Larger ranged GETs and blocks mean fewer REST calls for dataset archives and models
+max_single_get_size = 64 * 1024 * 1024
+max_chunk_get_size = 16 * 1024 * 1024
+max_block_size = 16 * 1024 * 1024
+max_single_put_size = 16 * 1024 * 1024
+
+@functools.lru_cache(maxsize=None)
+def get_blob_service_client(connection_string):
+    """Return a process-wide BlobServiceClient so all callers share one connection pool."""
+    logging.info("Initializing BlobServiceClient with the retrieved connection string.")
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=connection_pool_maxsize, pool_maxsize=connection_pool_maxsize))
+    return BlobServiceClient.from_connection_string(
+        connection_string,
+        max_single_get_size=max_single_get_size,
+        max_chunk_get_size=max_chunk_get_size,
+        max_block_size=max_block_size,
+        max_single_put_size=max_single_put_size,
+        transport=RequestsTransport(session=session)
+    )
+
+def create_async_blob_service_client(connection_string):
+    """Create an async BlobServiceClient with the same transfer tuning.
+
+    Not cached: aio clients are bound to the event loop they are used in, so
+    callers should use the result as an async context manager.
+    """
+    return AsyncBlobServiceClient.from_connection_string(
+        connection_string,
+        max_single_get_size=max_single_get_size,
+        max_chunk_get_size=max_chunk_get_size,
+        max_block_size=max_block_size,
+        max_single_put_size=max_single_put_size
+    )
@@ -0,0 +1,205 @@
+import io
+import os
+import zlib
+import struct
+import logging
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# ---------------------------
+# ZIP Layout
+# ---------------------------
+_EOCD_SIGNATURE = b'PK\x05\x06'
+_EOCD_FORMAT = '<4s4H2LH'
+_ZIP64_LOCATOR_SIGNATURE = b'PK\x06\x07'
+_ZIP64_LOCATOR_FORMAT = '<4sLQL'
+_ZIP64_EOCD_FORMAT = '<4sQ2H2L4Q'
+_ZIP64_MARKER = 0xFFFFFFFF
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_LOCAL_HEADER_FORMAT = '<4s5H3L2H'
+_LOCAL_HEADER_SIZE = struct.calcsize(_LOCAL_HEADER_FORMAT)
+
+# EOCD record + largest possible archive comment + ZIP64 locator
+_TAIL_SIZE = struct.calcsize(_EOCD_FORMAT) + 0xFFFF + struct.calcsize(_ZIP64_LOCATOR_FORMAT)
+
+class _TailReader(io.RawIOBase):
+    """Seekable view of a remote archive of which only the trailing bytes were downloaded."""
+
+    def __init__(self, tail, offset, size):
+        self._tail = tail
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = base + pos
+        return self._pos
+
+    def readinto(self, buffer):
+        start = self._pos - self._offset
+        if start < 0:
+            raise zipfile.BadZipFile("Attempted to read outside of the downloaded central directory.")
+        data = self._tail[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+def _read_central_directory(blob_client, size):
+    """Download the archive tail holding the central directory and return its entries and offset."""
+    tail_length = min(size, _TAIL_SIZE)
+    tail_offset = size - tail_length
+    tail = blob_client.download_blob(offset=tail_offset, length=tail_length).readall()
+
+    eocd = tail.rfind(_EOCD_SIGNATURE)
+    if eocd < 0:
+        raise zipfile.BadZipFile("End of central directory record not found.")
+    cd_offset = struct.unpack_from(_EOCD_FORMAT, tail, eocd)[6]
+
+    if cd_offset == _ZIP64_MARKER:
+        locator = eocd - struct.calcsize(_ZIP64_LOCATOR_FORMAT)
+        if locator < 0 or tail[locator:locator + 4] != _ZIP64_LOCATOR_SIGNATURE:
+            raise zipfile.BadZipFile("ZIP64 end of central directory locator not found.")
+        zip64_eocd_offset = struct.unpack_from(_ZIP64_LOCATOR_FORMAT, tail, locator)[2]
+        record = blob_client.download_blob(offset=zip64_eocd_offset, length=struct.calcsize(_ZIP64_EOCD_FORMAT)).readall()
+        cd_offset = struct.unpack(_ZIP64_EOCD_FORMAT, record)[9]
+
+    if cd_offset < tail_offset:
+        tail = blob_client.download_blob(offset=cd_offset, length=tail_offset - cd_offset).readall() + tail
+        tail_offset = cd_offset
+
+    with zipfile.ZipFile(_TailReader(tail, tail_offset, size), 'r') as zip_ref:
+        return zip_ref.infolist(), cd_offset
+
+# ---------------------------
+# Streaming Archive Extraction
+# ---------------------------
+def _target_path(info, target_dir):
+    """Resolve the extraction path of an archive member the same way ZipFile.extract does."""
+    arcname = info.filename.replace('/', os.path.sep)
+    if os.path.altsep:
+        arcname = arcname.replace(os.path.altsep, os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    parts = (x for x in arcname.split(os.path.sep) if x not in ('', os.path.curdir, os.path.pardir))
+    return os.path.join(target_dir, *parts)
+
+def _inflate_member(segment, segment_offset, info):
+    """Decompress one archive member from a downloaded byte range of the archive."""
+    start = info.header_offset - segment_offset
+    header = struct.unpack_from(_LOCAL_HEADER_FORMAT, segment, start)
+    if header[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    if info.flag_bits & 0x1:
+        raise NotImplementedError(f"Encrypted archive member {info.filename} is not supported.")
+
+    data_start = start + _LOCAL_HEADER_SIZE + header[9] + header[10]
+    data = segment[data_start:data_start + info.compress_size]
+    if info.compress_type == zipfile.ZIP_STORED:
+        content = data
+    elif info.compress_type == zipfile.ZIP_DEFLATED:
+        content = zlib.decompress(data, -15)
+    else:
+        raise NotImplementedError(f"Compression method {info.compress_type} of {info.filename} is not supported.")
+
+    if zlib.crc32(content) != info.CRC:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {info.filename}")
+    return content
+
+class _BufferWriter(io.RawIOBase):
+    """Write-only stream that fills a preallocated buffer in place."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        size = len(data)
+        self._buffer[self._pos:self._pos + size] = data
+        self._pos += size
+        return size
+
+_thread_buffers = threading.local()
+
+def _segment_buffer(length):
+    """Return a view of this worker thread's reusable download buffer, grown to fit length."""
+    buffer = getattr(_thread_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < length:
+        buffer = _thread_buffers.buffer = bytearray(length)
+    return memoryview(buffer)[:length]
+
+def _extract_segment(blob_client, start, end, members, target_dir):
+    """Download a byte range of the archive and write out the members it contains."""
+    # Each worker downloads into the same buffer for every segment instead of allocating a new one
+    segment = _segment_buffer(end - start)
+    blob_client.download_blob(offset=start, length=end - start).readinto(_BufferWriter(segment))
+    for info in members:
+        content = _inflate_member(segment, start, info)
+        with open(_target_path(info, target_dir), 'wb') as f:
+            f.write(content)
+    return len(members)
+
+def _plan_segments(infos, cd_offset, segment_size):
+    """Group archive entries, in file order, into byte ranges of roughly segment_size."""
+    entries = sorted(infos, key=lambda info: info.header_offset)
+    ends = [info.header_offset for info in entries[1:]] + [cd_offset]
+
+    segments = []
+    start, members = None, []
+    for info, end in zip(entries, ends):
+        if start is None:
+            start = info.header_offset
+        if not info.is_dir():
+            members.append(info)
+        if end - start >= segment_size:
+            segments.append((start, end, members))
+            start, members = None, []
+    if start is not None:
+        segments.append((start, cd_offset, members))
+    return [segment for segment in segments if segment[2]]
+
+def extract_archive_blob(blob_client, target_dir, max_concurrency=16, segment_size=16 * 1024 * 1024):
+    """Extract a ZIP archive blob straight into target_dir without storing the archive locally.
+
+    The central directory is fetched from the tail of the blob first, then the
+    body is downloaded in entry-aligned ranges by worker threads, each of which
+    inflates its members in memory and writes them to disk. Returns the number
+    of files extracted into each directory, tallied from the central directory.
+    """
+    size = blob_client.get_blob_properties().size
+    infos, cd_offset = _read_central_directory(blob_client, size)
+
+    # Create every directory up front so workers never race on makedirs
+    file_counts = {}
+    for info in infos:
+        path = _target_path(info, target_dir)
+        if info.is_dir():
+            os.makedirs(path, exist_ok=True)
+        else:
+            parent = os.path.dirname(path)
+            os.makedirs(parent, exist_ok=True)
+            file_counts[parent] = file_counts.get(parent, 0) + 1
+
+    segments = _plan_segments(infos, cd_offset, segment_size)
+    logging.info(f"Extracting {len(segments)} archive segments with {max_concurrency} worker threads.")
+
+    # zlib releases the GIL while inflating, so threads overlap decompression as well as network I/O
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(_extract_segment, blob_client, start, end, members, target_dir)
+                   for start, end, members in segments]
+        extracted = sum(future.result() for future in as_completed(futures))
+
+    logging.info(f"Extracted {extracted} files to {target_dir}.")
+    return file_counts
@@ -0,0 +1,203 @@
+import os
+import sys
+import glob
+import json
+import random
+import hashlib
+import logging
+
+import tensorflow as tf
+
+# ---------------------------
+# TFRecord Shard Settings
+# ---------------------------
+image_size = (224, 224)
+class_names = ['fire', 'nofire']
+image_extensions = ('.bmp', '.gif', '.jpeg', '.jpg', '.png')
+jpeg_ratios = (1, 2, 4, 8)  # DCT scaling factors supported by libjpeg
+num_shards = 16
+manifest_name = "manifest.json"
+# Bump whenever decoding, resizing or the record layout changes, so existing shards are rebuilt
+shard_format_version = 1
+
+_feature_description = {
+    'image': tf.io.FixedLenFeature([], tf.string),
+    'label': tf.io.FixedLenFeature([], tf.int64),
+}
+
+# ---------------------------
+# Writing Shards
+# ---------------------------
+def list_images(data_dir):
+    """List image paths under the class directories of data_dir, labelled by class index."""
+    paths, labels = [], []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(data_dir, class_name)
+        with os.scandir(class_dir) as entries:
+            names = sorted(entry.name for entry in entries
+                           if entry.is_file() and entry.name.lower().endswith(image_extensions))
+        paths.extend(os.path.join(class_dir, name) for name in names)
+        labels.extend([label] * len(names))
+    return paths, labels
+
+def _decode_jpeg(contents):
+    """Decode a JPEG with the fast IDCT, DCT-scaled by the largest ratio that still covers image_size."""
+    shape = tf.image.extract_jpeg_shape(contents)
+    scale = tf.minimum(shape[0] // image_size[0], shape[1] // image_size[1])
+    # Index of the largest ratio not above scale; libjpeg then skips the IDCT work for discarded pixels
+    branch = tf.reduce_sum(tf.cast(tf.constant(jpeg_ratios[1:]) <= scale, tf.int32))
+    return tf.switch_case(branch, [
+        lambda ratio=ratio: tf.io.decode_jpeg(contents, channels=3, ratio=ratio, dct_method='INTEGER_FAST')
+        for ratio in jpeg_ratios
+    ])
+
+def _load_image(path, label):
+    """Decode and resize one image to a uint8 tensor."""
+    contents = tf.io.read_file(path)
+    image = tf.cond(
+        tf.io.is_jpeg(contents),
+        lambda: _decode_jpeg(contents),
+        lambda: tf.io.decode_image(contents, channels=3, expand_animations=False)
+    )
+    image.set_shape([None, None, 3])
+    image = tf.image.resize(image, image_size)
+    return tf.saturate_cast(tf.round(image), tf.uint8), label
+
+def _serialize_example(image, label):
+    """Serialize a decoded image and its label as a tf.train.Example."""
+    feature = {
+        'image': tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+        'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+    }
+    return tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString()
+
+def write_shards(paths, labels, shards_dir, split):
+    """Decode every image once and write the results round-robin into TFRecord shards."""
+    for stale_path in glob.glob(os.path.join(shards_dir, f"{split}-*.tfrecord")):
+        os.remove(stale_path)
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    dataset = dataset.map(_load_image, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+    shard_paths = [os.path.join(shards_dir, f"{split}-{i:05d}-of-{num_shards:05d}.tfrecord") for i in range(num_shards)]
+    writers = [tf.io.TFRecordWriter(path) for path in shard_paths]
+    try:
+        for index, (image, label) in enumerate(dataset.as_numpy_iterator()):
+            writers[index % num_shards].write(_serialize_example(image, int(label)))
+    finally:
+        for writer in writers:
+            writer.close()
+
+    logging.info(f"Wrote {len(paths)} images to {num_shards} {split} shards in {shards_dir}.")
+    return shard_paths
+
+def _read_manifest(manifest_path):
+    """Load the shard manifest, or None if there is no usable one."""
+    try:
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _dataset_digest(paths, labels):
+    """Hash the sorted (path, label, size, mtime) listing, so replaced or re-extracted images are noticed."""
+    digest = hashlib.sha256()
+    for path, label in sorted(zip(paths, labels)):
+        stat = os.stat(path)
+        digest.update(f"{path}\0{label}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def build_shards(data_dir, shards_dir, splits, seed=481):
+    """Write TFRecord shards for data_dir, split by fraction, unless an up-to-date set exists.
+
+    splits maps split names to fractions of the dataset, e.g. {"train": 0.8, "validation": 0.2}.
+    Returns the shard manifest, including per-split "counts" and per-label "class_counts".
+    """
+    paths, labels = list_images(data_dir)
+    expected = {
+        "format_version": shard_format_version,
+        "dataset_digest": _dataset_digest(paths, labels),
+        "num_images": len(paths),
+        "class_counts": [labels.count(label) for label in range(len(class_names))],
+        "splits": splits,
+        "seed": seed,
+    }
+    manifest_path = os.path.join(shards_dir, manifest_name)
+    manifest = _read_manifest(manifest_path)
+    if manifest and all(manifest.get(key) == value for key, value in expected.items()):
+        logging.info(f"Reusing TFRecord shards in {shards_dir}.")
+        return manifest
+
+    logging.info(f"Building TFRecord shards for {len(paths)} images from {data_dir}.")
+    os.makedirs(shards_dir, exist_ok=True)
+    if manifest:
+        os.remove(manifest_path)  # The old shards are about to be overwritten
+
+    order = list(range(len(paths)))
+    random.Random(seed).shuffle(order)
+
+    counts, start = {}, 0
+    for index, (split, fraction) in enumerate(splits.items()):
+        end = len(order) if index == len(splits) - 1 else start + int(len(order) * fraction)
+        split_order = order[start:end]
+        write_shards([paths[i] for i in split_order], [labels[i] for i in split_order], shards_dir, split)
+        counts[split] = len(split_order)
+        start = end
+
+    # Written last, so an interrupted build is redone on the next run
+    manifest = {**expected, "counts": counts}
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file)
+    return manifest
+
+# ---------------------------
+# Reading Shards
+# ---------------------------
+def _parse_example(record):
+    """Parse a serialized example back into a uint8 image and int32 label."""
+    example = tf.io.parse_single_example(record, _feature_description)
+    image = tf.reshape(tf.io.decode_raw(example['image'], tf.uint8), (*image_size, 3))
+    return image, tf.cast(example['label'], tf.int32)
+
+def load_shards(shards_dir, split, cycle_length=num_shards):
+    """Read a split back as an unbatched dataset of (image, label) pairs."""
+    pattern = os.path.join(shards_dir, f"{split}-*.tfrecord")
+    if not glob.glob(pattern):
+        logging.error(f"No {split} shards found in {shards_dir}")
+        raise FileNotFoundError(f"No {split} shards found in {shards_dir}")
+
+    # Stream several shards at once; taking records from whichever shard is ready first
+    # avoids blocking on a slow read, at the cost of a non-deterministic record order
+    dataset = tf.data.Dataset.list_files(pattern, shuffle=False).interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=cycle_length,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=False
+    )
+    return dataset.map(_parse_example, num_parallel_calls=tf.data.AUTOTUNE)
+
+def prefetch_batches(dataset):
+    """Finish a batched dataset by prefetching into GPU memory when there is exactly one GPU.
+
+    Keras must not add transformations on top, so don't pass class_weight= to fit() with the result.
+    """
+    if len(tf.config.list_logical_devices('GPU')) == 1:
+        # The host-to-device copy of the next batch overlaps the current step; no map may follow this
+        return dataset.apply(tf.data.experimental.prefetch_to_device('/GPU:0', buffer_size=2))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+# ---------------------------
+# Main Logic
+# ---------------------------
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename='prepare_tfrecords.log',
+        filemode='a',  # Append mode
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    # Usage: python prepare_tfrecords.py <data_dir> <shards_dir> [validation_split]
+    data_dir, shards_dir = sys.argv[1], sys.argv[2]
+    validation_split = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+    build_shards(data_dir, shards_dir, {"train": 1 - validation_split, "validation": validation_split})
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import functools
+
+from azure.identity import DefaultAzureCredential, ManagedIdentityCredential
+from azure.keyvault.secrets import SecretClient
+
+# ---------------------------
+# Key Vault Secret Cache
+# ---------------------------
+cache_dir = "/mnt/data/.cache"
+cache_ttl_seconds = 60 * 60
+
+def _get_credential():
+    """Use the VM's managed identity directly when AZURE_USE_MSI is set, skipping the default credential chain."""
+    if os.getenv("AZURE_USE_MSI"):
+        return ManagedIdentityCredential()
+    return DefaultAzureCredential()
+
+def _cache_path(key_vault_name, secret_name):
+    """Build the cache file path for a secret, keyed by vault and secret name."""
+    key = hashlib.sha256(f"{key_vault_name}/{secret_name}".encode()).hexdigest()
+    return os.path.join(cache_dir, f"secret-{key}.json")
+
+def _remove_cached_secret(path):
+    """Delete a cached secret so it doesn't linger on the data disk."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Could not remove cached secret at {path}: {e}")
+
+def _read_cached_secret(path):
+    """Return the cached secret value, or None if it is missing or older than the TTL.
+
+    Expired or unreadable entries are deleted, since they hold the secret in plaintext.
+    """
+    try:
+        with open(path, 'r') as file:
+            entry = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        _remove_cached_secret(path)
+        return None
+    if not isinstance(entry, dict) or time.time() - entry.get("fetched_at", 0) > cache_ttl_seconds:
+        _remove_cached_secret(path)
+        return None
+    return entry.get("value")
+
+def _write_cached_secret(path, value):
+    """Persist a secret value to a file readable only by the current user."""
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as file:
+            json.dump({"fetched_at": time.time(), "value": value}, file)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not cache secret at {path}: {e}")
+
+@functools.lru_cache(maxsize=None)
+def get_cached_secret(key_vault_name, secret_name):
+    """Retrieve a Key Vault secret, reusing a local copy fetched within the last hour."""
+    path = _cache_path(key_vault_name, secret_name)
+    value = _read_cached_secret(path)
+    if value:
+        logging.info(f"Using cached secret {secret_name} from {path}.")
+        return value
+
+    logging.info(f"Retrieving secret {secret_name} from Key Vault {key_vault_name}.")
+    KVUri = f"https://{key_vault_name}.vault.azure.net/"
+    secret_client = SecretClient(vault_url=KVUri, credential=_get_credential())
+    value = secret_client.get_secret(secret_name).value
+
+    if value:
+        _write_cached_secret(path, value)
+    return value
@@ -1,10 +1,9 @@
 import os
 import json
+import asyncio
 import logging
 
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from azure_clients import get_storage_connection_string, create_async_blob_service_client
 
 # ---------------------------
 # Config Setup
@@ -40,21 +39,6 @@ logging.info("Started downloading model...")
 # Configuration & Key Vault Setup
 # ---------------------------
 key_vault_name = config["key_vault_name"]        # e.g. "mykeyvault"
-storage_connection_string_secret_name = "AzureStorageConnectionString"
-
-KVUri = f"https://{key_vault_name}.vault.azure.net/"
-credential = DefaultAzureCredential()
-secret_client = SecretClient(vault_url=KVUri, credential=credential)
-
-logging.info("Attempting to retrieve Azure Storage connection string from Key Vault.")
-connection_string_secret = secret_client.get_secret(storage_connection_string_secret_name)
-connection_string = connection_string_secret.value
-
-if not connection_string:
-    logging.error("Azure Storage connection string not found or empty.")
-    raise ValueError("Azure Storage connection string not found or empty.")
-else:
-    logging.info("Successfully retrieved Azure Storage connection string.")
 
 # ---------------------------
 # Azure Storage configuration
@@ -64,24 +48,41 @@ model_container_name = config["model_container_name"]
 dataset_archive = config["dataset_archive"]
 model_name = config["model_name"]
 
-blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-model_blob_client = blob_service_client.get_container_client(model_container_name)
+# Parallel chunked download settings for the model file
+download_concurrency = 8
 
 # ---------------------------
 # Fetch and Load Model
 # ---------------------------
-def fetch_model_from_azure(model_name):
+async def fetch_model_from_azure(model_container_client, model_name):
     """Fetch the model from Azure Blob Storage."""
     logging.info(f"Fetching model: {model_name} from Azure Blob Storage.")
     local_model_path = f"models/{model_name}"
-    if not os.path.exists("models"):
-        os.makedirs("models")
+    os.makedirs("models", exist_ok=True)
 
-    blob_client = model_blob_client.get_blob_client(model_name)
+    # Stream chunks straight into the file instead of buffering the whole model in memory
+    stream = await model_container_client.download_blob(model_name, max_concurrency=download_concurrency)
     with open(local_model_path, "wb") as file:
-        file.write(blob_client.download_blob().readall())
+        await stream.readinto(file)
     logging.info(f"Model saved locally at {local_model_path}")
     return local_model_path
 
-model_path = fetch_model_from_azure(model_name)
+async def fetch_models_from_azure(model_names):
+    """Fetch several models concurrently over a single async client."""
+    async with create_async_blob_service_client(get_storage_connection_string(key_vault_name)) as blob_service_client:
+        model_container_client = blob_service_client.get_container_client(model_container_name)
+        results = await asyncio.gather(
+            *(fetch_model_from_azure(model_container_client, name) for name in model_names),
+            return_exceptions=True
+        )
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    for name, result in zip(model_names, results):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to fetch model {name}: {result}")
+    if failures:
+        raise failures[0]
+    return results
+
+model_path = asyncio.run(fetch_models_from_azure([model_name]))[0]
 print(model_path)
\ No newline at end of file
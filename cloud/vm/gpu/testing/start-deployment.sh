@@ -10,6 +10,10 @@ required_files=(
   "$SHARED_PATH/vm-driver-setup.sh"
   "$SHARED_PATH/vm-python-setup.sh"
   "$SHARED_PATH/vm-disk-mount.sh"
+  "$SHARED_PATH/dataset_archive.py"
+  "$SHARED_PATH/secrets_cache.py"
+  "$SHARED_PATH/azure_clients.py"
+  "$SHARED_PATH/prepare_tfrecords.py"
   "testing.py"
   "download-model.py"
   "download-dataset.py"
@@ -1,10 +1,9 @@
 import os
 import logging
 import json
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+from prepare_tfrecords import build_shards, load_shards, prefetch_batches
 
 # ---------------------------
 # Logging Setup
@@ -47,16 +46,11 @@ model_name = config["model_name"]
 fire_directory = 'fire'
 nofire_directory = 'nofire'
 data_dir = "/mnt/data/testing"
+shards_dir = "/mnt/data/shards/testing"
 
 fire_path = os.path.join(data_dir, fire_directory)
 nofire_path = os.path.join(data_dir, nofire_directory)
 
-KVUri = f"https://{key_vault_name}.vault.azure.net/"
-credential = DefaultAzureCredential()
-secret_client = SecretClient(vault_url=KVUri, credential=credential)
-
-logging.info("Attempting to retrieve Azure Storage connection string from Key Vault.")
-
 model_path = f"models/{model_name}"
 
 model = tf.keras.models.load_model(model_path)
@@ -65,14 +59,22 @@ logging.info(f"Successfully loaded model from {model_path}")
 # ---------------------------
 # Test Data Preparation
 # ---------------------------
-test_datagen = ImageDataGenerator(rescale=1.0 / 255)
-test_generator = test_datagen.flow_from_directory(
-    data_dir,
-    target_size=(224, 224),
-    batch_size=32,
-    class_mode='binary',
-    shuffle=True
-)
+# Images are decoded and resized once into uint8 TFRecord shards, so repeated evaluations skip
+# JPEG decoding. They stay in the 0-255 range when the model rescales them in its first layer.
+build_shards(data_dir, shards_dir, {"test": 1.0})
+
+test_generator = load_shards(shards_dir, 'test').batch(32)
+
+# Models trained before Rescaling moved into the model expect inputs already scaled to 0-1
+first_layer = next(layer for layer in model.layers if not isinstance(layer, tf.keras.layers.InputLayer))
+if not isinstance(first_layer, tf.keras.layers.Rescaling):
+    logging.warning(f"Model {model_name} has no Rescaling input layer; scaling test images to 0-1 in the pipeline.")
+    test_generator = test_generator.map(
+        lambda images, labels: (tf.cast(images, tf.float32) / 255.0, labels),
+        num_parallel_calls=tf.data.AUTOTUNE
+    )
+
+test_generator = prefetch_batches(test_generator)
 
 # ---------------------------
 # Model Evaluation
@@ -80,7 +82,6 @@ test_generator = test_datagen.flow_from_directory(
 logging.info("Starting model evaluation.")
 test_loss, test_accuracy, test_precision, test_recall = model.evaluate(
     test_generator,
-    steps=test_generator.samples // test_generator.batch_size,
     verbose=1
 )
 
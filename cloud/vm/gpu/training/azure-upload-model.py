@@ -1,10 +1,10 @@
 import os
+import sys
 import logging
 import datetime
 import json
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+
+from azure_clients import get_storage_connection_string, get_blob_service_client
 
 def setup_logging():
     """Setup logging configuration."""
@@ -37,49 +37,36 @@ config = load_config()
 # Key Vault Setup
 # ---------------------------
 key_vault_name = config["key_vault_name"]        # e.g. "mykeyvault"
-storage_connection_string_secret_name = "AzureStorageConnectionString"
-
-KVUri = f"https://{key_vault_name}.vault.azure.net/"
-credential = DefaultAzureCredential()
-secret_client = SecretClient(vault_url=KVUri, credential=credential)
-
-logging.info("Attempting to retrieve Azure Storage connection string from Key Vault.")
-connection_string_secret = secret_client.get_secret(storage_connection_string_secret_name)
-connection_string = connection_string_secret.value
-
-if not connection_string:
-    logging.error("Azure Storage connection string not found or empty.")
-    raise ValueError("Azure Storage connection string not found or empty.")
-else:
-    logging.info("Successfully retrieved Azure Storage connection string.")
 
 # ---------------------------
 # Azure Blob Storage Setup
 # ---------------------------
 model_container_name = config["model_container_name"]
-blob_service_client = BlobServiceClient.from_connection_string(connection_string)
 
-logging.info("BlobServiceClient initialized.")
+# Parallel block upload settings for the model file
+upload_concurrency = 8
 
-def upload_model_to_blob(model_filepath, vm_size):
-    """Upload a model to Azure Blob Storage."""
+def upload_model_to_blob(model_filepath, vm_size, blob_name=None):
+    """Upload a model to Azure Blob Storage, by default named after the date, VM size and file name."""
     if not os.path.exists(model_filepath):
         logging.error(f"Model file not found: {model_filepath}")
         raise FileNotFoundError(f"Model file not found: {model_filepath}")
 
-    # Get the current date
-    date_str = datetime.datetime.now().strftime("%Y-%m-%d")
+    if blob_name is None:
+        # Get the current date
+        date_str = datetime.datetime.now().strftime("%Y-%m-%d")
 
-    # Define the blob name
-    model_filename = os.path.basename(model_filepath)
-    blob_name = f"{date_str}-GPU-{vm_size}-{model_filename}"
+        # Define the blob name
+        model_filename = os.path.basename(model_filepath)
+        blob_name = f"{date_str}-GPU-{vm_size}-{model_filename}"
 
     logging.info(f"Uploading {model_filepath} to Azure Blob Storage as {blob_name}.")
 
     # Upload the model to Azure Blob Storage
+    blob_service_client = get_blob_service_client(get_storage_connection_string(key_vault_name))
     model_blob_client = blob_service_client.get_blob_client(container=model_container_name, blob=blob_name)
     with open(model_filepath, "rb") as data:
-        model_blob_client.upload_blob(data, overwrite=True)
+        model_blob_client.upload_blob(data, overwrite=True, max_concurrency=upload_concurrency)
 
     logging.info(f"Model successfully uploaded to Azure Blob Storage: {blob_name}")
 
@@ -87,11 +74,16 @@ def upload_model_to_blob(model_filepath, vm_size):
 # Main Logic
 # ---------------------------
 if __name__ == "__main__":
-    model_filepath = "/mnt/data/saved_models_per_epoch/model_epoch_1_07.keras"
+    # Per-epoch checkpoints are weights only, so the full .keras model path is passed explicitly
+    if len(sys.argv) < 2:
+        logging.error("No model file given.")
+        raise SystemExit("Usage: python azure-upload-model.py <model_filepath> [blob_name]")
+    model_filepath = sys.argv[1]
+    blob_name = sys.argv[2] if len(sys.argv) > 2 else None  # Given to retry an upload under its original name
     vm_size = config.get("vm_size", "Unknown_VM")
 
     try:
-        upload_model_to_blob(model_filepath, vm_size)
+        upload_model_to_blob(model_filepath, vm_size, blob_name)
     except Exception as e:
         logging.error(f"An error occurred during the model upload: {e}")
         raise
\ No newline at end of file
@@ -2,16 +2,15 @@ import os
 import datetime
 import json
 import logging
-import zipfile
 
-from tensorflow.keras.utils import image_dataset_from_directory
+import tensorflow as tf
 from tensorflow.keras.applications.resnet50 import ResNet50
 from tensorflow.keras.callbacks import ModelCheckpoint
-from tensorflow.keras import layers, models, optimizers, metrics, Sequential
+from tensorflow.keras import layers, models, optimizers, metrics, mixed_precision, Sequential
 
-from azure.storage.blob import BlobServiceClient
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from azure_clients import get_storage_connection_string, get_blob_service_client
+from dataset_archive import extract_archive_blob
+from prepare_tfrecords import build_shards, load_shards, prefetch_batches
 
 # tf.debugging.set_log_device_placement(True) # Enable to test if GPU is assigned to perform operations
 
@@ -49,21 +48,6 @@ logging.info("Training script started. Initializing setup...")
 # Configuration & Key Vault Setup
 # ---------------------------
 key_vault_name = config["key_vault_name"]        # e.g. "mykeyvault"
-storage_connection_string_secret_name = "AzureStorageConnectionString"
-
-KVUri = f"https://{key_vault_name}.vault.azure.net/"
-credential = DefaultAzureCredential()
-secret_client = SecretClient(vault_url=KVUri, credential=credential)
-
-logging.info("Attempting to retrieve Azure Storage connection string from Key Vault.")
-connection_string_secret = secret_client.get_secret(storage_connection_string_secret_name)
-connection_string = connection_string_secret.value
-
-if not connection_string:
-    logging.error("Azure Storage connection string not found or empty.")
-    raise ValueError("Azure Storage connection string not found or empty.")
-else:
-    logging.info("Successfully retrieved Azure Storage connection string.")
 
 # ---------------------------
 # Azure Storage configuration
@@ -76,13 +60,39 @@ vm_size = config["vm_size"]
 fire_directory = 'fire'
 nofire_directory = 'nofire'
 data_dir = "/mnt/data/training"
+shards_dir = "/mnt/data/shards/training"
 
 fire_path = os.path.join(data_dir, fire_directory)
 nofire_path = os.path.join(data_dir, nofire_directory)
 
-logging.info("Initializing BlobServiceClient with the retrieved connection string.")
-blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-container_client = blob_service_client.get_container_client(container_name)
+# Parallel transfer settings for the dataset archive download and the trained model upload
+download_concurrency = 16
+upload_concurrency = 8
+# tmpfs, so the final model is staged for upload in memory
+upload_staging_dir = "/dev/shm"
+
+# ---------------------------
+# Training configuration
+# ---------------------------
+# Per-GPU batch size; the global batch and learning rate scale with the number of GPUs below
+batch_size = config.get("batch_size", 128)
+# XLA can regress for some shapes, so it can be switched off to compare step times
+jit_compile = config.get("jit_compile", True)
+# 'mixed_float16' for T4/V100 tensor cores, 'mixed_bfloat16' on A100 and newer, 'float32' to disable
+precision_policy = config.get("precision_policy", "mixed_float16")
+# Train only the classifier head on ResNet50 features computed once, instead of fine-tuning the backbone
+feature_extraction = config.get("feature_extraction", False)
+# First ResNet50 block to fine-tune; earlier blocks keep their ImageNet weights. null fine-tunes every block.
+fine_tune_from = config.get("fine_tune_from", "conv4_block1")
+
+# Replicate the model across all GPUs of multi-GPU VM sizes; a single GPU keeps the default strategy
+if len(tf.config.list_logical_devices('GPU')) > 1:
+    strategy = tf.distribute.MirroredStrategy()
+else:
+    strategy = tf.distribute.get_strategy()
+global_batch_size = batch_size * strategy.num_replicas_in_sync
+learning_rate = 0.00001 * strategy.num_replicas_in_sync
+logging.info(f"Training on {strategy.num_replicas_in_sync} replica(s) with a global batch size of {global_batch_size}.")
 
 # ---------------------------
 # Helper Functions
@@ -90,15 +100,9 @@ container_client = blob_service_client.get_container_client(container_name)
 imageNumber = {}
 
 def prepare_dataset():
-    # 0. Create data directory if doesn't exist
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir, exist_ok=True)
-    
-    # Make sure directories exist (creating them if they don't)
-    if not os.path.exists(fire_path):
-        os.makedirs(fire_path, exist_ok=True)
-    if not os.path.exists(nofire_path):
-        os.makedirs(nofire_path, exist_ok=True)
+    # 0. Make sure the class directories (and data_dir above them) exist
+    os.makedirs(fire_path, exist_ok=True)
+    os.makedirs(nofire_path, exist_ok=True)
     
     # 1. Instead of fetching images from Azure directly, 
     # we first try to count images already present in /mnt/data.
@@ -107,8 +111,9 @@ def prepare_dataset():
         # We'll assume all files are images for simplicity.
         if not os.path.exists(dir_path):
             return 0
-        files = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
-        return len(files)
+        # DirEntry.is_file() reuses the file type from the directory read, no stat per file
+        with os.scandir(dir_path) as entries:
+            return sum(1 for entry in entries if entry.is_file())
     
     imageNumber[fire_path] = count_images_in_dir(fire_path)
     imageNumber[nofire_path] = count_images_in_dir(nofire_path)
@@ -117,26 +122,18 @@ def prepare_dataset():
     if imageNumber[fire_path] == 0 or imageNumber[nofire_path] == 0:
         logging.info("At least one directory is empty. Attempting to download and extract the dataset archive.")
 
-        # 2.1. Download the archive from blob storage if we haven't got images locally
-        archive_local_path = os.path.join(data_dir, dataset_archive)
-        
-        # Download the archive
-        logging.info(f"Downloading dataset archive {dataset_archive} from container {container_name}.")
-        blob_client = container_client.get_blob_client(dataset_archive)
-        with open(archive_local_path, 'wb') as f:
-            stream = blob_client.download_blob()
-            for chunk in stream.chunks():
-                f.write(chunk)
-        logging.info("Download completed in chunks.")
+        # 2.1. Stream the archive from blob storage if we haven't got images locally.
+        # Members are inflated in memory and written straight to data_dir (should contain
+        # fire_directory and nofire_directory); the archive itself never touches disk.
+        logging.info(f"Streaming dataset archive {dataset_archive} from container {container_name} into {data_dir}.")
+        blob_service_client = get_blob_service_client(get_storage_connection_string(key_vault_name))
+        blob_client = blob_service_client.get_blob_client(container=container_name, blob=dataset_archive)
+        extracted_counts = extract_archive_blob(blob_client, data_dir, max_concurrency=download_concurrency)
+        logging.info(f"Download and extraction completed using {download_concurrency} parallel connections.")
         
-        # 2.2. Extract the content (should contain fire_directory and nofire_directory)
-        logging.info(f"Extracting archive {archive_local_path} to {data_dir}.")
-        with zipfile.ZipFile(archive_local_path, 'r') as zip_ref:
-            zip_ref.extractall(data_dir)
-        
-        # After extraction, we recalculate the image numbers
-        imageNumber[fire_path] = count_images_in_dir(fire_path)
-        imageNumber[nofire_path] = count_images_in_dir(nofire_path)
+        # After extraction, we take the image numbers from the archive listing instead of rescanning
+        imageNumber[fire_path] = extracted_counts.get(fire_path, 0)
+        imageNumber[nofire_path] = extracted_counts.get(nofire_path, 0)
 
         # If after extraction at least one is still 0, exit with error
         if imageNumber[fire_path] == 0 or imageNumber[nofire_path] == 0:
@@ -149,31 +146,79 @@ def prepare_dataset():
     logging.info(f"Image counts: {imageNumber}")
     return imageNumber
 
-def create_model():
+feature_pooling_layer_name = "feature_pooling"
+
+def compile_model(model):
+    """Compile a model with the training optimizer, loss and metrics."""
+    optimizer = optimizers.Adam(learning_rate=learning_rate)
+    if precision_policy == 'mixed_float16':
+        # float16 gradients can underflow; bfloat16 has float32's exponent range and needs no loss scaling
+        optimizer = mixed_precision.LossScaleOptimizer(optimizer)
+
+    model.compile(
+        optimizer=optimizer,
+        loss='binary_crossentropy',
+        metrics=['accuracy', metrics.Precision(name='precision'), metrics.Recall(name='recall')],
+        jit_compile=jit_compile  # XLA-fuse the train step into fewer GPU kernels
+    )
+
+def create_model(train_backbone=True):
     """Create a ResNet50-based model."""
     logging.info("Creating ResNet50-based model.")
     base_model = ResNet50(input_shape=(224, 224, 3),
                           include_top=False,
                           weights='imagenet')
-    base_model.trainable = True
+    # A frozen backbone also runs its BatchNormalization layers in inference mode
+    base_model.trainable = train_backbone
+
+    if train_backbone and fine_tune_from:
+        # Frozen early blocks skip their weight gradients in the backward pass
+        cutoff = next((i for i, layer in enumerate(base_model.layers) if layer.name.startswith(f"{fine_tune_from}_")), None)
+        if cutoff is None:
+            logging.error(f"ResNet50 block {fine_tune_from} not found")
+            raise ValueError(f"ResNet50 block {fine_tune_from} not found")
+        for layer in base_model.layers[:cutoff]:
+            layer.trainable = False
+        logging.info(f"Fine-tuning ResNet50 from {fine_tune_from}; {cutoff} earlier layers frozen.")
 
     model = models.Sequential([
+        layers.Input(shape=(224, 224, 3)),
+        layers.Rescaling(1./255),  # Runs on the GPU as part of the model instead of in the input pipeline
         base_model,
-        layers.GlobalAveragePooling2D(),
+        layers.GlobalAveragePooling2D(name=feature_pooling_layer_name),  # Backbone/head boundary for feature extraction
         layers.BatchNormalization(),
         layers.Dense(512, activation='relu'),
         layers.BatchNormalization(),
         layers.Dropout(0.5),
-        layers.Dense(1, activation='sigmoid')
+        layers.Dense(1, activation='sigmoid', dtype='float32')  # Keep the output and loss in float32
     ])
-    model.compile(
-        optimizer=optimizers.Adam(learning_rate=0.00001),
-        loss='binary_crossentropy',
-        metrics=['accuracy', metrics.Precision(name='precision'), metrics.Recall(name='recall')]
-    )
-    logging.info("Model created and compiled successfully.")
+    compile_model(model)
+    logging.info(f"Model created and compiled successfully (jit_compile={jit_compile}).")
     return model
 
+def split_feature_extraction(model):
+    """Split the model into its backbone (up to global pooling) and a head sharing the remaining layers."""
+    layer_names = [layer.name for layer in model.layers]
+    if feature_pooling_layer_name not in layer_names:
+        logging.error(f"Layer {feature_pooling_layer_name} not found in model")
+        raise ValueError(f"Layer {feature_pooling_layer_name} not found in model")
+    pooling_index = layer_names.index(feature_pooling_layer_name)
+    pooling_layer = model.layers[pooling_index]
+
+    feature_extractor = models.Model(model.inputs, pooling_layer.output)
+    head = models.Sequential([layers.Input(shape=pooling_layer.output.shape[1:]), *model.layers[pooling_index + 1:]])
+    compile_model(head)
+    return feature_extractor, head
+
+def extract_features(feature_extractor, dataset):
+    """Run the frozen backbone once over a batched dataset and return an unbatched dataset of features."""
+    extract = tf.function(lambda images: feature_extractor(images, training=False), jit_compile=jit_compile)
+    features, labels = [], []
+    for images, batch_labels in dataset:
+        features.append(extract(images))
+        labels.append(batch_labels)
+    return tf.data.Dataset.from_tensor_slices((tf.concat(features, axis=0), tf.concat(labels, axis=0)))
+
 def save_model_to_azure(model, epoch):
     """Save the model to Azure Blob Storage at specified epoch using the .keras format."""
     if epoch == 5:
@@ -184,28 +229,52 @@ def save_model_to_azure(model, epoch):
         # Define the filename
         model_filename = f"{date_str}-GPU-{vm_size}-epoch-{epoch}.keras"
 
-        # Save the model locally in .keras format
-        model_filepath = f"{save_dir}/{model_filename}"
+        # Save the model in .keras format to tmpfs, so reading it back for the upload never touches the disk
+        # (Keras needs a real .keras path, not a BytesIO)
+        model_filepath = f"{upload_staging_dir}/{model_filename}"
         model.save(model_filepath)  # This will create a .keras file
-        logging.info(f"Model saved locally at {model_filepath}")
+        logging.info(f"Model saved for upload at {model_filepath}")
 
         # Upload the model to Azure Blob Storage
-        model_blob_client = blob_service_client.get_blob_client(container=model_container_name, blob=model_filename)
-        with open(model_filepath, "rb") as data:
-            model_blob_client.upload_blob(data, overwrite=True)
+        try:
+            blob_service_client = get_blob_service_client(get_storage_connection_string(key_vault_name))
+            model_blob_client = blob_service_client.get_blob_client(container=model_container_name, blob=model_filename)
+            with open(model_filepath, "rb") as data:
+                model_blob_client.upload_blob(data, overwrite=True, max_concurrency=upload_concurrency)
+        except Exception:
+            # Epoch checkpoints are weights only, so keep the full model around for a manual retry
+            logging.error(f"Model upload failed; retry with: python azure-upload-model.py {model_filepath} {model_filename}")
+            raise
+        os.remove(model_filepath)  # Free the shared memory it occupies
 
         logging.info(f"Model uploaded to Azure Blob Storage as {model_filename}")
 
 # ---------------------------
-# Load data and prepare class weights
+# Load data
 # ---------------------------
 logging.info("Loading and preparing data.")
 prepare_dataset()
 
 print(imageNumber)
 
-num_fire_images = imageNumber[fire_path]
-num_nofire_images = imageNumber[nofire_path]
+# ---------------------------
+# Split Data into Training and Validation
+# ---------------------------
+print("Splitting data into training and validation sets.")
+
+# Images are decoded and resized once into uint8 TFRecord shards that later runs reuse
+shard_manifest = build_shards(data_dir, shards_dir, {"train": 0.8, "validation": 0.2}, seed=481)
+
+train_generator = load_shards(shards_dir, 'train')
+# Validation batches stay uint8; the model's float32 Input casts them on the device
+validation_generator = load_shards(shards_dir, 'validation').batch(global_batch_size)
+
+# ---------------------------
+# Prepare class weights
+# ---------------------------
+# Counted over the images that were sharded, so stray non-image files in the class directories
+# don't skew the weights. Labels are class indices in class_names order ['fire', 'nofire'].
+num_fire_images, num_nofire_images = shard_manifest["class_counts"]
 
 total_images = num_fire_images + num_nofire_images
 
@@ -215,80 +284,101 @@ if num_fire_images == 0 or num_nofire_images == 0:
 
 weight_for_fire = (1 / num_fire_images) * (total_images) / 2.0
 weight_for_nofire = (1 / num_nofire_images) * (total_images) / 2.0
-class_weights = {0: weight_for_nofire, 1: weight_for_fire}
+# fire is label 0 and nofire is label 1
+class_weights = {0: weight_for_fire, 1: weight_for_nofire}
 
-print(f"Class weights calculated: no fire={class_weights[0]}, fire={class_weights[1]}")
+print(f"Class weights calculated: fire={class_weights[0]}, no fire={class_weights[1]}")
 
 # ---------------------------
-# Split Data into Training and Validation
+# Training Input Pipeline
 # ---------------------------
-print("Splitting data into training and validation sets.")
-
-train_generator = image_dataset_from_directory(
-    data_dir,
-    image_size=(224, 224),
-    batch_size=32,
-    subset='training',
-    class_names=['fire', 'nofire'],
-    validation_split=0.2,
-    seed=481,
-    shuffle=True
-)
-
-validation_generator = image_dataset_from_directory(
-    data_dir,
-    image_size=(224, 224),
-    batch_size=32,
-    class_names=['fire', 'nofire'],
-    validation_split=0.2,
-    subset='validation',
-    seed=481,
-    shuffle=False
-)
-
 data_augmentation = Sequential([
-    layers.Rescaling(1./255),
     layers.RandomRotation(0.1),
     layers.RandomZoom(0.2),
     layers.RandomFlip("horizontal")
 ])
 
-train_generator = train_generator.map(
-    lambda x, y: (data_augmentation(x, training=True), y)
-)
+# Traced once for the fixed 224x224x3 batch shape instead of per call. Augmentation stays in the
+# input pipeline because RandomRotation/RandomZoom have no XLA kernel and the model is jit-compiled.
+@tf.function(input_signature=[
+    tf.TensorSpec(shape=(None, 224, 224, 3), dtype=tf.uint8),
+    tf.TensorSpec(shape=(None,), dtype=tf.int32)
+])
+def augment(images, labels):
+    """Apply random augmentation to a batch of training images."""
+    return data_augmentation(tf.cast(images, tf.float32), training=True), labels
 
-validation_generator = validation_generator.map(
-    lambda x, y: (layers.Rescaling(1./255)(x), y)
-)
+# Class weights are applied as per-example sample weights inside the pipeline: fit(class_weight=...)
+# would append a host-side map after prefetch_to_device, which must stay the last transformation
+class_weight_table = tf.constant([class_weights[0], class_weights[1]], dtype=tf.float32)
+
+def add_sample_weights(images, labels):
+    """Attach each example's class weight as its sample weight."""
+    return images, labels, tf.gather(class_weight_table, labels)
+
+# Shards are read only in the first epoch; augmentation stays after the cache so it differs per epoch.
+# Dropping the last partial batch keeps every train step the same shape, so XLA compiles it only once.
+train_generator = prefetch_batches(train_generator.cache().shuffle(1000, seed=481).batch(global_batch_size, drop_remainder=True).map(
+    augment,
+    num_parallel_calls=tf.data.AUTOTUNE
+).map(add_sample_weights, num_parallel_calls=tf.data.AUTOTUNE))
+
+validation_generator = prefetch_batches(validation_generator.cache())
 
 # ---------------------------
 # Create local directory to save models per epoch
 # ---------------------------
 save_dir = '/mnt/data/saved_models_per_epoch'
-if not os.path.exists(save_dir):
-    os.makedirs(save_dir)
-    logging.info(f"Directory {save_dir} created for saving models.")
+os.makedirs(save_dir, exist_ok=True)
+logging.info(f"Saving models to directory {save_dir}.")
 
 # ---------------------------
 # Build and Train Model
 # ---------------------------
-model = create_model()
-
-checkpoint = ModelCheckpoint(
-    filepath=f"{save_dir}/model_epoch_1_{{epoch:02d}}.keras",
-    save_best_only=False,
-    save_weights_only=False,
-    verbose=1
-)
+# Run matmuls/convolutions in half precision on the GPU tensor cores, keeping float32 variables
+mixed_precision.set_global_policy(precision_policy)
+logging.info(f"Mixed precision policy set to {precision_policy}.")
+
+# Variables and optimizer state are created in the strategy scope so they are mirrored on every GPU;
+# fit() then splits each global batch across the replicas
+with strategy.scope():
+    model = create_model(train_backbone=not feature_extraction)
+    if feature_extraction:
+        feature_extractor, head = split_feature_extraction(model)
+
+if feature_extraction:
+    # The head shares its layers with the full model, so training it trains the model that gets saved.
+    # Features are computed from unaugmented images, as augmentation can't vary across cached epochs.
+    logging.info("Extracting ResNet50 features for head-only training.")
+
+    train_features = extract_features(feature_extractor, prefetch_batches(load_shards(shards_dir, 'train').batch(global_batch_size)))
+    validation_features = extract_features(feature_extractor, prefetch_batches(load_shards(shards_dir, 'validation').batch(global_batch_size)))
+
+    logging.info("Starting head training on cached features.")
+    history = head.fit(
+        train_features.cache().shuffle(1000, seed=481).batch(global_batch_size, drop_remainder=True).map(
+            add_sample_weights,
+            num_parallel_calls=tf.data.AUTOTUNE
+        ).prefetch(tf.data.AUTOTUNE),
+        epochs=5,
+        validation_data=validation_features.batch(global_batch_size).cache().prefetch(tf.data.AUTOTUNE)
+    )
+else:
+    # Weights only: the full model is serialized once, by save_model_to_azure after the last epoch
+    checkpoint = ModelCheckpoint(
+        filepath=f"{save_dir}/weights_{{epoch:02d}}.weights.h5",
+        save_best_only=False,
+        save_weights_only=True,
+        verbose=1
+    )
 
-logging.info("Starting model training.")
-history = model.fit(
-    train_generator,
-    epochs=5,
-    validation_data=validation_generator,
-    class_weight=class_weights,
-    callbacks=[checkpoint]
-)
+    logging.info("Starting model training.")
+    history = model.fit(
+        train_generator,
+        epochs=5,
+        validation_data=validation_generator,
+        callbacks=[checkpoint]
+    )
 logging.info("Model training completed.")
 
 # ---------------------------